@@ -1,23 +1,50 @@
+import functools
+import hashlib
 import os
 import json
-from github import Github, GithubException
+from github import Github, GithubException, GithubRetry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 CONFIG_FILE = 'profile_config.json'
+# Aliases per GraphQL request, kept small to stay under GitHub's query cost limit.
+GRAPHQL_BATCH_SIZE = 20
+HTTP_POOL_SIZE = 20
+REPO_METADATA_FIELDS = 'id description repositoryTopics(first: 20) { nodes { topic { name } } }'
 
 def load_config(path=CONFIG_FILE):
+    if orjson is not None:
+        with open(path, 'rb') as fh:
+            return orjson.loads(fh.read())
     with open(path, 'r', encoding='utf-8') as fh:
         return json.load(fh)
 
 def ensure_profile_repo(gh, username):
     repo_name = f"{username}"
     full_name = f"{username}/{repo_name}"
+    query = """
+    query($owner: String!, $name: String!) {
+      repository(owner: $owner, name: $name) { id object(expression: "HEAD:README.md") { ... on Blob { oid } } }
+    }
+    """
     try:
-        return gh.get_repo(full_name)
+        repository = gh.graphql(query, owner=username, name=repo_name).get('repository')
     except GithubException:
+        repository = None
+    if repository is None:
         user = gh.get_user()
-        return user.create_repo(repo_name, auto_init=True, private=False)
+        return user.create_repo(repo_name, auto_init=True, private=False), None
+    readme = repository['object']
+    return gh.get_repo(full_name, lazy=True), readme['oid'] if readme else None
 
-def update_readme(repo, config):
+def git_blob_sha(text):
+    blob = text.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0%s' % (len(blob), blob)).hexdigest()
+
+def update_readme(repo, config, readme_sha=None):
     bio = config.get('bio', '')
     lines = [bio, '']
     projects = config.get('projects', [])
@@ -34,24 +61,105 @@ def update_readme(repo, config):
         lines.append(' '.join(icon_strs))
         lines.append('')
     content = '\n'.join(lines)
-    try:
-        existing = repo.get_contents('README.md')
-        repo.update_file(existing.path, 'Update README', content, existing.sha)
-    except GithubException:
-        repo.create_file('README.md', 'Add README', content)
+    if readme_sha is None:
+        try:
+            readme_sha = repo.get_contents('README.md').sha
+        except GithubException:
+            repo.create_file('README.md', 'Add README', content)
+            return
+    if readme_sha == git_blob_sha(content):
+        return
+    repo.update_file('README.md', 'Update README', content, readme_sha)
 
 def set_project_metadata(gh, projects):
-    for p in projects:
-        repo_full = p['url'].split('github.com/')[-1]
-        try:
-            r = gh.get_repo(repo_full)
-            r.edit(description=p.get('description'))
+    repos = [(p['url'].split('github.com/')[-1], p) for p in projects]
+    nodes = fetch_repositories(gh, [full_name for full_name, _ in repos], REPO_METADATA_FIELDS)
+    targets = [(nodes[full_name], p) for full_name, p in repos if full_name in nodes]
+    # Each project contributes up to two aliased mutations.
+    for batch in _chunks(targets, GRAPHQL_BATCH_SIZE // 2):
+        params, fields, variables = [], [], {}
+        for i, (node, p) in enumerate(batch):
+            current_topics = {t['topic']['name'] for t in node['repositoryTopics']['nodes']}
+            description = p.get('description')
+            if description is not None and description != node['description']:
+                params.append(f'$d{i}:String')
+                variables[f'd{i}'] = description
+                fields.append(
+                    f'p{i}_desc: updateRepository(input:{{repositoryId:$id{i}, description:$d{i}}}) {{ clientMutationId }}'
+                )
             topics = p.get('topics', [])
-            if topics:
-                r.replace_topics(topics)
+            if topics and set(topics) != current_topics:
+                params.append(f'$t{i}:[String!]!')
+                variables[f't{i}'] = topics
+                fields.append(
+                    f'p{i}_topics: updateTopics(input:{{repositoryId:$id{i}, topicNames:$t{i}}}) {{ clientMutationId }}'
+                )
+            if f'd{i}' in variables or f't{i}' in variables:
+                params.append(f'$id{i}:ID!')
+                variables[f'id{i}'] = node['id']
+        if not fields:
+            continue
+        try:
+            gh.graphql(f'mutation({", ".join(params)}) {{ {" ".join(fields)} }}', **variables)
         except GithubException:
             pass
 
+def _chunks(items, size=GRAPHQL_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _only_not_found(exc):
+    body = exc.data if isinstance(exc.data, dict) else {}
+    errors = body.get('errors') or []
+    return bool(errors) and all(e.get('type') == 'NOT_FOUND' for e in errors)
+
+def fetch_repositories(gh, full_names, fields='id'):
+    nodes = {}
+    for batch in _chunks(list(full_names)):
+        variables = {}
+        for i, full_name in enumerate(batch):
+            variables[f'o{i}'], variables[f'n{i}'] = full_name.split('/', 1)
+        try:
+            data = gh.graphql(_repo_query_template(len(batch), fields), **variables)
+        except GithubException as exc:
+            if not _only_not_found(exc):
+                raise
+            data = exc.data.get('data')
+            if data is None:
+                if len(batch) > 1:
+                    # One missing or renamed repository failed the batch; look the rest up singly.
+                    for full_name in batch:
+                        nodes.update(fetch_repositories(gh, [full_name], fields))
+                continue
+        for i, full_name in enumerate(batch):
+            node = data.get(f'r{i}')
+            if node:
+                nodes[full_name] = node
+    return nodes
+
+def resolve_repo_ids(gh, full_names):
+    return {full_name: node['id'] for full_name, node in fetch_repositories(gh, full_names).items()}
+
+@functools.lru_cache(maxsize=32)
+def _repo_query_template(n, fields='id'):
+    params = ', '.join(f'$o{i}:String!, $n{i}:String!' for i in range(n))
+    body = ' '.join(f'r{i}: repository(owner:$o{i}, name:$n{i}) {{ {fields} }}' for i in range(n))
+    return f'query({params}) {{ {body} }}'
+
+@functools.lru_cache(maxsize=32)
+def _mutation_template(mutation, alias, n):
+    params = ', '.join(f'$id{i}:ID!' for i in range(n))
+    fields = ' '.join(
+        f'{alias}{i}: {mutation}(input:{{repositoryId:$id{i}}}) {{ clientMutationId }}'
+        for i in range(n)
+    )
+    return f'mutation({params}) {{ {fields} }}'
+
+def _repo_mutation(gh, mutation, alias, repo_ids):
+    for batch in _chunks(list(repo_ids)):
+        template = _mutation_template(mutation, alias, len(batch))
+        gh.graphql(template, **{f'id{i}': nid for i, nid in enumerate(batch)})
+
 def pin_repositories(gh, username, repo_names):
     user_query = """
     query($login: String!) {
@@ -59,16 +167,17 @@ def pin_repositories(gh, username, repo_names):
     }
     """
     data = gh.graphql(user_query, login=username)
-    user_id = data['user']['id']
-    pinned = data['user']['pinnedItems']['nodes']
-    unpin = """mutation($repoId:ID!){ unpinRepository(input:{repositoryId:$repoId}) { clientMutationId } }"""
-    for node in pinned:
-        gh.graphql(unpin, repoId=node['id'])
-    pin = """mutation($repoId:ID!){ pinRepository(input:{repositoryId:$repoId}) { clientMutationId } }"""
-    for name in repo_names:
+    pinned = [node['id'] for node in data['user']['pinnedItems']['nodes']]
+    full_names = [name if '/' in name else f"{username}/{name}" for name in repo_names]
+    repo_ids = resolve_repo_ids(gh, full_names)
+    to_pin = [repo_ids[name] for name in full_names if name in repo_ids]
+    if repo_names and not to_pin:
+        return
+    if pinned:
+        _repo_mutation(gh, 'unpinRepository', 'u', pinned)
+    if to_pin:
         try:
-            repo = gh.get_repo(name if '/' in name else f"{username}/{name}")
-            gh.graphql(pin, repoId=repo.node_id)
+            _repo_mutation(gh, 'pinRepository', 'p', to_pin)
         except GithubException:
             pass
 
@@ -76,9 +185,21 @@ def main():
     token = os.environ['GITHUB_TOKEN']
     username = os.environ['GITHUB_USERNAME']
     config = load_config()
-    gh = Github(token)
-    repo = ensure_profile_repo(gh, username)
-    update_readme(repo, config)
+    gh = Github(
+        token,
+        per_page=100,
+        pool_size=HTTP_POOL_SIZE,
+        # POSTs (GraphQL, create_repo) are not idempotent, so they are only
+        # retried on connection errors, never on a response status.
+        retry=GithubRetry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=GithubRetry.DEFAULT_ALLOWED_METHODS,
+        ),
+    )
+    repo, readme_sha = ensure_profile_repo(gh, username)
+    update_readme(repo, config, readme_sha)
     set_project_metadata(gh, config.get('projects', []))
     pin_repositories(gh, username, config.get('pinned', []))
 
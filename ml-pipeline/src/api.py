@@ -1,14 +1,125 @@
-from flask import Flask, request, jsonify
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+import os
+import queue
+import threading
+import time
+
+from flask import Flask, abort, request, jsonify
 import joblib
+import numpy as np
+import onnxruntime as ort
+
+MODEL_PATH = '../models/model.joblib'
+ONNX_MODEL_PATH = '../models/model.onnx'
+BATCH_SIZE = 64
+BATCH_WAIT = 0.005
+PREDICT_TIMEOUT = 5
+
+
+def _load_predictor():
+    if os.path.exists(ONNX_MODEL_PATH):
+        options = ort.SessionOptions()
+        # gunicorn already runs one worker per core; more threads here only oversubscribe.
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            ONNX_MODEL_PATH, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        inputs = session.get_inputs()[0]
+
+        def predict_rows(rows):
+            return session.run(None, {inputs.name: np.asarray(rows, dtype=np.float32)})[0]
+
+        return predict_rows, inputs.shape[1]
+    model = joblib.load(MODEL_PATH, mmap_mode='r')
+    return model.predict, model.n_features_in_
+
 
 app = Flask(__name__)
-model = joblib.load('../models/model.joblib')
+predict_rows, n_features = _load_predictor()
+try:
+    # Page in the model before the first real request.
+    predict_rows(np.zeros((1, n_features), dtype=np.float32))
+except Exception:
+    pass
+_pending = queue.Queue()
+
+
+def _batch_worker():
+    while True:
+        batch = [_pending.get()]
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Skip rows whose request already timed out and cancelled its future.
+        batch = [(features, future) for features, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            continue
+        try:
+            rows = predict_rows(np.asarray([features for features, _ in batch])).tolist()
+        except Exception:
+            # A malformed row fails the whole batch; retry singly so only it errors.
+            for features, future in batch:
+                try:
+                    future.set_result(predict_rows([features]).tolist()[0])
+                except Exception as exc:
+                    future.set_exception(exc)
+            continue
+        for (_, future), row in zip(batch, rows):
+            future.set_result(row)
+
+
+_worker = threading.Thread(target=_batch_worker, daemon=True)
+_worker.start()
+_worker_lock = threading.Lock()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if not _worker.is_alive():
+            _worker = threading.Thread(target=_batch_worker, daemon=True)
+            _worker.start()
+
+
+def _batched_predict(features):
+    _ensure_worker()
+    future = Future()
+    _pending.put((features, future))
+    try:
+        return [future.result(timeout=PREDICT_TIMEOUT)]
+    except FutureTimeoutError:
+        future.cancel()
+        abort(503, description='Prediction timed out')
+
+
+@lru_cache(maxsize=4096)
+def _cached_predict(features):
+    return _batched_predict(list(features))
+
 
 @app.route('/predict', methods=['POST'])
 def predict():
     data = request.json['data']
-    prediction = model.predict([data]).tolist()
+    try:
+        key = tuple(data)
+        hash(key)
+    except TypeError:
+        # Nested or otherwise unhashable payloads skip the cache.
+        key = None
+    if key is None:
+        prediction = _batched_predict(data)
+    else:
+        prediction = _cached_predict(key)
     return jsonify({'prediction': prediction})
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py).
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,6 @@
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 8
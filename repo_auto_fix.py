@@ -4,6 +4,8 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import functools
 import json
 import os
 import re
@@ -12,23 +14,53 @@ import sys
 from pathlib import Path
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMMAND_TIMEOUT = 120
+_NAME_RE = re.compile(r"name=['\"]([^'\"]+)['\"]")
+_DESC_RE = re.compile(r"description=['\"]([^'\"]+)['\"]")
+
 
 def log(msg: str) -> None:
     print(f"[repo-auto-fix] {msg}")
 
 
-def run(cmd: list[str], cwd: Optional[Path] = None) -> tuple[int, str]:
-    process = subprocess.run(
-        cmd,
+def json_loads(data: str | bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+async def run_async(
+    cmd: list[str], cwd: Optional[Path] = None, timeout: float = COMMAND_TIMEOUT
+) -> tuple[int, str]:
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
         cwd=cwd,
-        capture_output=True,
-        text=True,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
     )
-    if process.stdout:
-        log(process.stdout.strip())
-    if process.stderr:
-        log(process.stderr.strip())
-    return process.returncode, process.stdout + process.stderr
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        log(f"{' '.join(cmd)} timed out after {timeout}s")
+        return -1, ""
+    out = stdout.decode(errors="replace")
+    err = stderr.decode(errors="replace")
+    if out:
+        log(out.strip())
+    if err:
+        log(err.strip())
+    return process.returncode, out + err
+
+
+def run(cmd: list[str], cwd: Optional[Path] = None) -> tuple[int, str]:
+    return asyncio.run(run_async(cmd, cwd))
 
 
 def git(cmd: list[str], cwd: Path) -> None:
@@ -37,7 +69,30 @@ def git(cmd: list[str], cwd: Path) -> None:
         raise RuntimeError(f"git {' '.join(cmd)} failed")
 
 
+def git_branch_and_toplevel(repo: Path) -> tuple[str, str]:
+    def git_output(*args: str) -> str:
+        return subprocess.check_output(
+            ["git", *args], cwd=repo, text=True, stderr=subprocess.DEVNULL
+        )
+
+    try:
+        branch, toplevel = git_output(
+            "rev-parse", "--abbrev-ref", "HEAD", "--show-toplevel"
+        ).splitlines()
+    except subprocess.CalledProcessError:
+        # A repository without commits has no HEAD to resolve, only an unborn branch.
+        toplevel = git_output("rev-parse", "--show-toplevel").strip()
+        branch = git_output("symbolic-ref", "--short", "HEAD").strip()
+    return branch, toplevel
+
+
 def detect_language(repo: Path) -> str:
+    return _detect_language_cached(str(repo))
+
+
+@functools.lru_cache(maxsize=None)
+def _detect_language_cached(path: str) -> str:
+    repo = Path(path)
     if (repo / "package.json").exists():
         return "node"
     if (repo / "requirements.txt").exists() or (repo / "setup.py").exists():
@@ -45,16 +100,16 @@ def detect_language(repo: Path) -> str:
     return "unknown"
 
 
-def run_linters(repo: Path, language: str) -> None:
+async def run_linters(repo: Path, language: str) -> None:
     if language == "node":
-        run(["npm", "install"], cwd=repo)
-        run(["npx", "eslint", ".", "--fix"], cwd=repo)
-        run(["npx", "prettier", "--write", "."], cwd=repo)
+        await run_async(["npm", "install"], cwd=repo)
+        await run_async(["npx", "eslint", ".", "--fix"], cwd=repo)
+        await run_async(["npx", "prettier", "--write", "."], cwd=repo)
     elif language == "python":
         if not (repo / "pyproject.toml").exists():
             (repo / "pyproject.toml").write_text("[tool.black]\nline-length = 88\n")
-        run(["python", "-m", "black", "."], cwd=repo)
-        run(["python", "-m", "flake8", "."], cwd=repo)
+        await run_async(["python", "-m", "black", "."], cwd=repo)
+        await run_async(["python", "-m", "flake8", "."], cwd=repo)
 
 
 def ensure_gitignore(repo: Path, language: str) -> None:
@@ -68,22 +123,22 @@ def ensure_gitignore(repo: Path, language: str) -> None:
         patterns = ["__pycache__/", "*.pyc", ".venv/"]
     else:
         patterns = []
-    for p in patterns:
-        if p not in entries:
-            entries.append(p)
-    if entries:
+    seen = set(entries)
+    missing = [p for p in patterns if p not in seen]
+    if missing:
+        entries.extend(missing)
         path.write_text("\n".join(entries) + "\n")
 
 
 def parse_package_json(repo: Path) -> tuple[str, str]:
-    data = json.loads((repo / "package.json").read_text())
+    data = json_loads((repo / "package.json").read_bytes())
     return data.get("name", repo.name), data.get("description", "")
 
 
 def parse_setup_py(repo: Path) -> tuple[str, str]:
     text = (repo / "setup.py").read_text()
-    name = re.search(r"name=['\"]([^'\"]+)['\"]", text)
-    desc = re.search(r"description=['\"]([^'\"]+)['\"]", text)
+    name = _NAME_RE.search(text)
+    desc = _DESC_RE.search(text)
     return (name.group(1) if name else repo.name, desc.group(1) if desc else "")
 
 
@@ -99,16 +154,20 @@ def update_readme(repo: Path, language: str) -> None:
         lines = [f"# {title}", "", desc, ""]
     else:
         lines = readme.read_text().splitlines()
-    sections = {
-        "Installation": "Instructions for installing dependencies.",
-        "Usage": "Examples of how to use this project.",
-        "Tests": "How to run tests.",
-        "Contributing": "Guidelines for contributing.",
-        "License": "This project is licensed under the MIT License.",
-        "Architecture": "![Architecture](docs/architecture.png)",
-    }
-    for header, content in sections.items():
-        if not any(l.startswith(f"## {header}") for l in lines):
+    sections = [
+        ("Installation", "Instructions for installing dependencies."),
+        ("Usage", "Examples of how to use this project."),
+        ("Tests", "How to run tests."),
+        ("Contributing", "Guidelines for contributing."),
+        ("License", "This project is licensed under the MIT License."),
+        ("Architecture", "![Architecture](docs/architecture.png)"),
+    ]
+    # Index every header by the prefix lengths we test, so "## Installation:" still
+    # counts as an Installation section.
+    lengths = {len(header) for header, _ in sections}
+    existing_headers = {l[3:3 + n] for l in lines if l.startswith("## ") for n in lengths}
+    for header, content in sections:
+        if header not in existing_headers:
             lines.extend([f"## {header}", content, ""])
     readme.write_text("\n".join(lines).strip() + "\n")
 
@@ -165,24 +224,52 @@ def ensure_ci(repo: Path, language: str) -> None:
 
 
 
-def update_dependencies(repo: Path, language: str) -> None:
+async def update_dependencies(repo: Path, language: str) -> None:
     if language == "node":
-        code, out = run(["npm", "outdated", "--json"], cwd=repo)
+        code, out = await run_async(["npm", "outdated", "--json"], cwd=repo)
         if code == 0 and out:
-            run(["npm", "update"], cwd=repo)
+            await run_async(["npm", "update"], cwd=repo)
     elif language == "python":
-        code, out = run(["pip", "list", "--outdated", "--format=json"], cwd=repo)
+        code, out = await run_async(
+            [sys.executable, "-m", "pip", "list", "--outdated", "--format=json"], cwd=repo
+        )
         if code == 0 and out:
             try:
-                pkgs = json.loads(out)
+                pkgs = json_loads(out)
             except json.JSONDecodeError:
                 pkgs = []
-            for pkg in pkgs:
-                run(["pip", "install", f"{pkg['name']}=={pkg['latest_version']}"])
+            if pkgs:
+                pins = [f"{pkg['name']}=={pkg['latest_version']}" for pkg in pkgs]
+                # Keep the old per-package budget now that one call installs them all.
+                code, _ = await run_async(
+                    [sys.executable, "-m", "pip", "install", *pins],
+                    timeout=COMMAND_TIMEOUT * len(pins),
+                )
+                if code != 0:
+                    # One conflicting pin fails the whole resolve; upgrade what we can singly.
+                    log("Batched pip install failed; retrying packages individually")
+                    for pin in pins:
+                        await run_async([sys.executable, "-m", "pip", "install", pin])
             req = repo / "requirements.txt"
             if req.exists():
-                frozen = subprocess.check_output([sys.executable, "-m", "pip", "freeze"]).decode()
-                req.write_text(frozen)
+                # Stream into a sibling file so a failed freeze leaves requirements.txt intact.
+                tmp = req.with_name(req.name + ".tmp")
+                try:
+                    with tmp.open("wb") as fh:
+                        process = await asyncio.create_subprocess_exec(
+                            sys.executable, "-m", "pip", "freeze", stdout=fh
+                        )
+                        try:
+                            code = await asyncio.wait_for(process.wait(), COMMAND_TIMEOUT)
+                        finally:
+                            if process.returncode is None:
+                                process.kill()
+                                await process.wait()
+                    if code != 0:
+                        raise RuntimeError("pip freeze failed")
+                    tmp.replace(req)
+                finally:
+                    tmp.unlink(missing_ok=True)
 
 
 def update_github_metadata(repo: Path) -> None:
@@ -211,37 +298,106 @@ def update_github_metadata(repo: Path) -> None:
         ghr.replace_topics(topics)
 
 
-def commit_and_push(repo: Path, branch: str) -> None:
+COMMIT_MESSAGE = "chore: apply automated quality improvements"
+
+
+def commit_with_git(repo: Path, message: str) -> bool:
     git(["add", "-A"], repo)
     code, _ = run(["git", "diff", "--cached", "--quiet"], cwd=repo)
     if code == 0:
+        return False
+    git(["commit", "-m", message], repo)
+    return True
+
+
+def needs_git_cli(repository) -> bool:
+    # pygit2 skips clean filters (e.g. git-lfs), commit signing and hooks.
+    config = repository.config
+    if "commit.gpgsign" in config and config.get_bool("commit.gpgsign"):
+        return True
+    if "core.hooksPath" in config:
+        return True
+    hooks = Path(repository.path) / "hooks"
+    if hooks.is_dir() and any(not h.name.endswith(".sample") for h in hooks.iterdir()):
+        return True
+    workdir = Path(repository.workdir)
+    attributes = [Path(repository.path) / "info" / "attributes", workdir / ".gitattributes"]
+    attributes += [workdir / e.path for e in repository.index if e.path.endswith(".gitattributes")]
+    return any(a.is_file() and "filter=" in a.read_text(errors="replace") for a in attributes)
+
+
+def commit_changes(repo: Path, message: str) -> bool:
+    try:
+        import pygit2
+    except ImportError:
+        return commit_with_git(repo, message)
+    repository = pygit2.Repository(str(repo))
+    if needs_git_cli(repository):
+        return commit_with_git(repo, message)
+    index = repository.index
+    index.add_all()
+    for path, flags in repository.status().items():
+        if flags & pygit2.GIT_STATUS_WT_DELETED:
+            index.remove(path)
+    index.write()
+    if repository.head_is_unborn:
+        if len(index) == 0:
+            return False
+        parents = []
+    else:
+        parents = [repository.head.target]
+    tree = index.write_tree()
+    if parents and repository[parents[0]].tree_id == tree:
+        return False
+    signature = repository.default_signature
+    repository.create_commit("HEAD", signature, signature, message, tree, parents)
+    return True
+
+
+def commit_and_push(repo: Path, branch: str) -> None:
+    if not commit_changes(repo, COMMIT_MESSAGE):
         log("No changes to commit")
         return
-    git(["commit", "-m", "chore: apply automated quality improvements"], repo)
     git(["push", "origin", branch], repo)
 
 
+async def improve(repo: Path, lang: str) -> None:
+    await run_linters(repo, lang)
+    # Once the formatters have run, the scaffolding files are independent of
+    # each other. Let every one settle before surfacing a failure.
+    results = await asyncio.gather(
+        asyncio.to_thread(ensure_gitignore, repo, lang),
+        asyncio.to_thread(update_readme, repo, lang),
+        asyncio.to_thread(ensure_license, repo),
+        asyncio.to_thread(ensure_ci, repo, lang),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    # pip may rewrite packages this process imports (PyGithub, requests,
+    # certifi), so the metadata update only starts once it has finished.
+    await update_dependencies(repo, lang)
+    update_github_metadata(repo)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Improve a local repository")
     parser.add_argument("path", help="Path to the repository")
     args = parser.parse_args()
     repo = Path(args.path).expanduser().resolve()
-    if not (repo / ".git").exists():
+    try:
+        branch, toplevel = git_branch_and_toplevel(repo)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
         raise SystemExit(f"{repo} is not a git repository")
+    repo = Path(toplevel)
     os.chdir(repo)
-    branch = subprocess.check_output(["git", "rev-parse", "--abbrev-ref", "HEAD"]).decode().strip()
     log(f"Using branch {branch}")
     lang = detect_language(repo)
     log(f"Detected language: {lang}")
 
     try:
-        run_linters(repo, lang)
-        ensure_gitignore(repo, lang)
-        update_readme(repo, lang)
-        ensure_license(repo)
-        ensure_ci(repo, lang)
-        update_dependencies(repo, lang)
-        update_github_metadata(repo)
+        asyncio.run(improve(repo, lang))
         commit_and_push(repo, branch)
         log("Repository improvements complete")
     except Exception as exc:
@@ -1,10 +1,22 @@
+import os
+from pathlib import Path
+
 from python_terraform import Terraform
 
+WORKING_DIR = Path('infrastructure')
+PARALLELISM = 50
+
 
 def deploy():
-    tf = Terraform(working_dir='infrastructure')
-    tf.init()
-    tf.apply(skip_plan=True)
+    plugin_cache = Path(os.environ.setdefault(
+        'TF_PLUGIN_CACHE_DIR', str(Path.home() / '.terraform.d' / 'plugin-cache')
+    ))
+    plugin_cache.mkdir(parents=True, exist_ok=True)
+    tf = Terraform(working_dir=str(WORKING_DIR))
+    if not (WORKING_DIR / '.terraform' / 'providers').exists():
+        tf.init()
+    # State locking is only skipped in CI, where a single writer is guaranteed.
+    tf.apply(skip_plan=True, parallelism=PARALLELISM, lock=not os.environ.get('CI'))
 
 
 if __name__ == '__main__':